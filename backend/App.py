@@ -1,13 +1,20 @@
 import os
-import json
 import re
 import logging
+import atexit
+import math
+import pickle
+import queue
+from collections import defaultdict
 from urllib.parse import urljoin, quote_plus
 
 # --- Modern Asynchronous & Caching Imports ---
+import orjson # Fast JSON (de)serialization for results and config
 import httpx  # Modern, async replacement for 'requests'
 import redis # For caching results
+from redis.asyncio import Redis # Non-blocking client for use inside the event loop
 import anyio # To run async functions within Flask
+import ahocorasick # Multi-term matching in a single pass
 
 # --- Flask and Environment Imports ---
 from flask import Flask, request, Response, jsonify
@@ -15,15 +22,9 @@ from flask_cors import CORS
 from dotenv import load_dotenv
 
 # --- Standard Scraping Imports ---
-from bs4 import BeautifulSoup
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service as ChromeService
-from selenium.webdriver.chrome.options import Options as ChromeOptions
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, WebDriverException
-from webdriver_manager.chrome import ChromeDriverManager
+from lxml import etree, html as lxml_html
+from cssselect import GenericTranslator
+from playwright.async_api import async_playwright, Error as PlaywrightError
 
 # --- Initial Setup ---
 load_dotenv() # Load environment variables from .env file
@@ -33,27 +34,142 @@ app = Flask(__name__)
 # Load CORS origins from environment variables for security
 CORS(app, origins=os.getenv('CORS_ORIGIN', '*').split(','))
 
+# --- Background Event Loop ---
+# Flask runs async views on a throwaway event loop per request, which would tear down
+# pooled connections. Long-lived async resources instead live on one persistent loop.
+_portal_manager = anyio.from_thread.start_blocking_portal()
+PORTAL = _portal_manager.__enter__()
+
+def configure_thread_limiter():
+    # HTML parsing runs in worker threads; lxml releases the GIL while parsing
+    anyio.to_thread.current_default_thread_limiter().total_tokens = (os.cpu_count() or 1) * 4
+PORTAL.call(configure_thread_limiter)
+
+async def run_background_tasks(*, task_status=anyio.TASK_STATUS_IGNORED):
+    """Hosts tasks that must outlive the client request that started them."""
+    async with anyio.create_task_group() as tg:
+        task_status.started(tg)
+        await anyio.sleep_forever()
+_background_future, BACKGROUND_TASKS = PORTAL.start_task(run_background_tasks)
+
+def stream_from_portal(async_gen):
+    """Runs an async generator on the background loop and yields its items to a sync response."""
+    items = queue.Queue()
+    done = object()
+
+    async def pump():
+        try:
+            async for item in async_gen:
+                items.put(item)
+        except Exception as e:
+            logging.error(f"Stream error: {e}")
+        finally:
+            items.put(done)
+
+    future = PORTAL.start_task_soon(pump)
+    try:
+        while (item := items.get()) is not done:
+            yield item
+    finally:
+        # Stops this client's stream if it disconnects; shared scrapes keep running
+        future.cancel()
+
+# --- Shared HTTP Client ---
+# Reused across requests so TLS/TCP connections are kept alive and multiplexed (HTTP/2)
+HTTP_CLIENT = httpx.AsyncClient(
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+    http2=True,
+    timeout=15.0,
+    headers={
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/98.0.4758.82 Safari/537.36',
+        'Accept-Encoding': 'gzip, deflate, br', # Decompressed transparently by httpx ('br' needs brotli)
+    },
+    follow_redirects=True,
+)
+
+# --- Outbound Concurrency Limits ---
+# Caps total in-flight page fetches across all searches, plus a politeness limit per site
+GLOBAL_OUT = anyio.Semaphore(64)
+PER_HOST = defaultdict(lambda: anyio.Semaphore(4))
+
+@atexit.register
+def shutdown_event_loop():
+    _background_future.cancel()
+    PORTAL.call(HTTP_CLIENT.aclose)
+    if redis_client:
+        PORTAL.call(redis_client.aclose)
+    _portal_manager.__exit__(None, None, None)
+
 # --- Redis Cache Connection ---
 try:
-    redis_client = redis.from_url(
+    redis_client = Redis.from_url(
         os.getenv('REDIS_URL'),
         decode_responses=True # Decode responses to UTF-8 automatically
     )
-    redis_client.ping() # Check if the connection is successful
+    PORTAL.call(redis_client.ping) # Check if the connection is successful
     print("Successfully connected to Redis.")
 except redis.exceptions.ConnectionError as e:
     print(f"Could not connect to Redis: {e}. Caching will be disabled.")
     redis_client = None
 
 # --- Configuration Loading ---
+CSS_TRANSLATOR = GenericTranslator()
+
+def translate_selector(css_selector, relative=False):
+    """Translates a CSS selector into an XPath expression.
+
+    Relative selectors only match descendants of the context node, like BeautifulSoup's select_one.
+    """
+    prefix = 'descendant::' if relative else 'descendant-or-self::'
+    return CSS_TRANSLATOR.css_to_xpath(css_selector, prefix=prefix)
+
+def parse_sites_json(config_path):
+    """Parses and sorts sites.json, translating each site's selectors to XPath strings."""
+    with open(config_path, 'rb') as f:
+        config_data = orjson.loads(f.read())
+    # Sort the config alphabetically by name for consistent frontend display
+    config_data.sort(key=lambda x: x['name'])
+    for site in config_data:
+        title_selector = site['title_from_item'].get('selector')
+        link_selector = site['link_from_item'].get('selector')
+        site['_item_xpath_source'] = translate_selector(site['result_item_selector'])
+        site['_title_xpath_source'] = translate_selector(title_selector, relative=True) if title_selector else None
+        site['_link_xpath_source'] = translate_selector(link_selector, relative=True) if link_selector else None
+    return config_data
+
+def compile_site_xpaths(config_data):
+    # Compiled XPath objects can't be pickled, so compile from the translated strings here
+    for site in config_data:
+        site['_item_xpath'] = etree.XPath(site['_item_xpath_source'])
+        site['_title_xpath'] = etree.XPath(site['_title_xpath_source']) if site['_title_xpath_source'] else None
+        site['_link_xpath'] = etree.XPath(site['_link_xpath_source']) if site['_link_xpath_source'] else None
+    return config_data
+
+# Bump whenever parse_sites_json or translate_selector changes what ends up in the snapshot
+SITES_SNAPSHOT_VERSION = 1
+
 def load_sites_config():
-    """Loads scraper configurations from the sites.json file."""
-    config_path = os.path.join(os.path.dirname(__file__), 'config', 'sites.json')
-    with open(config_path, 'r', encoding='utf-8') as f:
-        config_data = json.load(f)
-        # Sort the config alphabetically by name for consistent frontend display
-        config_data.sort(key=lambda x: x['name'])
-        return config_data
+    """Loads scraper configurations, reusing a pickled snapshot of sites.json while the file is unchanged."""
+    config_dir = os.path.join(os.path.dirname(__file__), 'config')
+    config_path = os.path.join(config_dir, 'sites.json')
+    snapshot_path = os.path.join(config_dir, 'sites.cache.pkl')
+    config_mtime = os.path.getmtime(config_path)
+
+    try:
+        with open(snapshot_path, 'rb') as f:
+            snapshot = pickle.load(f)
+        if snapshot['version'] == SITES_SNAPSHOT_VERSION and snapshot['mtime'] == config_mtime:
+            return compile_site_xpaths(snapshot['sites'])
+    except Exception:
+        pass # Missing, unreadable or malformed snapshot; rebuild it below
+
+    config_data = parse_sites_json(config_path)
+    try:
+        with open(snapshot_path, 'wb') as f:
+            pickle.dump({'version': SITES_SNAPSHOT_VERSION, 'mtime': config_mtime, 'sites': config_data}, f)
+    except OSError as e:
+        print(f"Could not write sites config snapshot: {e}")
+    return compile_site_xpaths(config_data)
 SITES_CONFIG = load_sites_config()
 
 
@@ -63,105 +179,303 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 
 # --- Core Scraping Logic ---
 
+# Precompiled patterns used for every scraped title
+_FREE_DL_RE = re.compile(r'free download|download free', re.IGNORECASE)
+_DL_WORD_RE = re.compile(r'\b(?<!^)(download)\b', re.IGNORECASE)
+_NONWORD_RE = re.compile(r'[^\w]')
+# lxml rejects str input that starts with an XML declaration naming an encoding
+_XML_DECL_RE = re.compile(r'^\ufeff?\s*<\?xml[^>]*\?>')
+
 def clean_game_title(title):
     if not title: return title
     # Special case for RexaGames
     if 'METAL' in title:
         title = title.replace('METAL ', '').strip()
-    cleaned_title = re.sub(r'free download|download free', '', title, flags=re.IGNORECASE)
-    cleaned_title = re.sub(r'\b(?<!^)(download)\b', '', cleaned_title, flags=re.IGNORECASE)
+    cleaned_title = _FREE_DL_RE.sub('', title)
+    cleaned_title = _DL_WORD_RE.sub('', cleaned_title)
     return ' '.join(cleaned_title.split()).strip()
 
-def contains_all_terms(text, search_terms):
-    if not text or not search_terms: return False
-    cleaned_text_no_spaces = re.sub(r'[^\w]', '', text.lower())
-    for term in search_terms:
-        term_no_spaces = re.sub(r'[^\w]', '', term.lower())
-        if term_no_spaces not in cleaned_text_no_spaces:
-            return False
-    return True
+def clean_search_terms(query):
+    """Lowercases the query's terms and strips non-word characters, matching contains_all_terms."""
+    return [_NONWORD_RE.sub('', term) for term in query.lower().split()]
+
+def build_term_automaton(cleaned_terms):
+    """Builds an Aho-Corasick automaton over the cleaned search terms, or None if there are none."""
+    automaton = ahocorasick.Automaton()
+    for term in cleaned_terms:
+        if term:
+            automaton.add_word(term, term)
+    if not len(automaton): return None
+    automaton.make_automaton()
+    return automaton
+
+def contains_all_terms(text, term_automaton):
+    if not text or term_automaton is None: return False
+    cleaned_text_no_spaces = _NONWORD_RE.sub('', text.lower())
+    # One scan over the text finds every term; all matched means each distinct word was seen
+    found = {term for _, term in term_automaton.iter(cleaned_text_no_spaces)}
+    return len(found) == len(term_automaton)
+
+# Result items sit near the top of search pages, so the rest of an oversized page is skipped
+MAX_PAGE_BYTES = 2_000_000
 
 async def fetch_static_site(client, site_config, search_url):
-    """Asynchronously fetches content from a static website using httpx."""
-    headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/98.0.4758.82 Safari/537.36'}
+    """Asynchronously fetches up to MAX_PAGE_BYTES from a static website using the shared httpx client."""
     try:
-        response = await client.get(search_url, headers=headers, timeout=15.0, follow_redirects=True)
-        response.raise_for_status()
-        return response.text
-    except httpx.RequestError as e:
+        async with client.stream('GET', search_url) as response:
+            response.raise_for_status()
+            body = bytearray()
+            async for chunk in response.aiter_bytes():
+                body.extend(chunk)
+                if len(body) > MAX_PAGE_BYTES:
+                    del body[MAX_PAGE_BYTES:]
+                    break
+            try:
+                return body.decode(response.charset_encoding or 'utf-8', 'replace')
+            except LookupError: # Unknown charset in the Content-Type header
+                return body.decode('utf-8', 'replace')
+    except httpx.HTTPError as e:
         logging.error(f"HTTPX Error for {site_config['name']}: {e}")
         return None
 
-def fetch_js_site(site_config, search_url):
-    """Fetches content from a JS-heavy site using Selenium (runs synchronously)."""
-    options = ChromeOptions()
-    options.add_argument("--headless")
-    options.add_argument("--no-sandbox")
-    options.add_argument("--disable-dev-shm-usage")
-    options.add_argument("--disable-gpu")
-    options.add_argument("--log-level=3")
-    driver = None
+# --- Headless Browser ---
+# One Chromium and browser context are shared by all JS scrapes; each scrape opens its own page
+BLOCKED_RESOURCE_TYPES = {'image', 'font', 'stylesheet', 'media'}
+# Ad and tracker scripts add load time without affecting the results markup
+BLOCKED_URL_FRAGMENTS = ('google-analytics', 'googletagmanager', 'doubleclick', 'googlesyndication')
+
+async def block_subresources(route):
+    """Aborts requests for resources that aren't needed to read the result HTML."""
+    resource = route.request
+    if resource.resource_type in BLOCKED_RESOURCE_TYPES or any(fragment in resource.url for fragment in BLOCKED_URL_FRAGMENTS):
+        await route.abort()
+    else:
+        await route.continue_()
+
+PLAYWRIGHT = BROWSER = BROWSER_CONTEXT = None
+BROWSER_LOCK = anyio.Lock()
+
+async def close_browser():
+    """Closes the shared browser, if any, so the next JS scrape launches a fresh one."""
+    global BROWSER, BROWSER_CONTEXT
+    browser, BROWSER, BROWSER_CONTEXT = BROWSER, None, None
+    if browser:
+        try:
+            await browser.close()
+        except PlaywrightError:
+            pass # Already crashed or disconnected
+
+async def get_browser_context():
+    """Returns the shared browser context, (re)launching Chromium if it isn't running."""
+    global PLAYWRIGHT, BROWSER, BROWSER_CONTEXT
+    async with BROWSER_LOCK:
+        if BROWSER_CONTEXT is None or not BROWSER.is_connected():
+            await close_browser()
+            if PLAYWRIGHT is None:
+                PLAYWRIGHT = await async_playwright().start()
+            BROWSER = await PLAYWRIGHT.chromium.launch(headless=True, args=["--no-sandbox", "--disable-dev-shm-usage"])
+            BROWSER_CONTEXT = await BROWSER.new_context()
+            await BROWSER_CONTEXT.route("**/*", block_subresources)
+        return BROWSER_CONTEXT
+
+async def discard_browser_context(context):
+    """Drops a context that can no longer open pages, unless it was already replaced."""
+    async with BROWSER_LOCK:
+        if context is BROWSER_CONTEXT:
+            await close_browser()
+
+try:
+    PORTAL.call(get_browser_context)
+    print("Successfully launched headless Chromium.")
+except PlaywrightError as e:
+    print(f"Could not launch Chromium: {e}. JS-rendered sites will retry on demand.")
+
+@atexit.register
+def shutdown_browser():
+    PORTAL.call(close_browser)
+    if PLAYWRIGHT:
+        PORTAL.call(PLAYWRIGHT.stop)
+
+async def fetch_js_site(site_config, search_url):
+    """Asynchronously fetches content from a JS-heavy site using a page in the shared Playwright context."""
+    page = None
     try:
-        service = ChromeService(ChromeDriverManager().install())
-        driver = webdriver.Chrome(service=service, options=options)
-        driver.get(search_url)
+        context = await get_browser_context()
+        try:
+            page = await context.new_page()
+        except PlaywrightError:
+            # The browser crashed or the context broke; relaunch on the next scrape
+            await discard_browser_context(context)
+            raise
+        await page.goto(search_url, wait_until="domcontentloaded")
         if site_config.get('wait_for_selector'):
-            WebDriverWait(driver, 15).until(EC.presence_of_element_located((By.CSS_SELECTOR, site_config['wait_for_selector'])))
-        return driver.page_source
-    except Exception as e:
-        logging.error(f"Selenium Error for {site_config['name']}: {e}")
+            await page.wait_for_selector(site_config['wait_for_selector'], timeout=15000)
+        return await page.content()
+    except PlaywrightError as e:
+        logging.error(f"Playwright Error for {site_config['name']}: {e}")
         return None
     finally:
-        if driver:
-            driver.quit()
+        if page:
+            # Close the page even if the scrape is being cancelled
+            with anyio.CancelScope(shield=True):
+                try:
+                    await page.close()
+                except PlaywrightError:
+                    pass # The browser went away with the page
 
-def parse_html_and_extract(page_html, site_config, search_url, query):
-    """Parses HTML to find and validate a search result based on JSON config."""
+def first_match(xpath, node):
+    """Returns the first node matched by a compiled XPath expression, or None."""
+    matches = xpath(node)
+    return matches[0] if matches else None
+
+def node_text(node):
+    # Equivalent of BeautifulSoup's get_text(strip=True)
+    return ''.join(text.strip() for text in node.itertext())
+
+def parse_html_and_extract(page_html, site_config, search_url, term_automaton):
+    """Parses HTML to find and validate a search result based on JSON config.
+
+    Returns None when the page has no matching result; parsing failures raise instead.
+    """
     if not page_html: return None
+    tree = lxml_html.fromstring(_XML_DECL_RE.sub('', page_html, count=1))
+    item_node = first_match(site_config['_item_xpath'], tree)
+    if item_node is None: return None
+
+    # Extract title based on config
+    title_conf = site_config['title_from_item']
+    title_node = first_match(site_config['_title_xpath'], item_node) if site_config['_title_xpath'] else item_node
+    title = ""
+    if title_node is not None:
+        if title_conf['method'] == 'text':
+            title = node_text(title_node)
+        elif title_conf['method'] in ['alt', 'title']:
+            title = title_node.get(title_conf['method'], '')
+    
+    # Extract link based on config
+    link_conf = site_config['link_from_item']
+    link_node = first_match(site_config['_link_xpath'], item_node) if site_config['_link_xpath'] else item_node
+    link = link_node.get(link_conf['method']) if link_node is not None and link_conf.get('method') else None
+    
+    if not title or not link: return None
+
+    # Clean and validate
+    cleaned_title = clean_game_title(title)
+    if not contains_all_terms(cleaned_title, term_automaton):
+        return None
+
+    # Ensure link is absolute
+    link = urljoin(search_url, link)
+
+    return {
+        'site_id': site_config['id'],
+        'site_name': site_config['name'],
+        'result': {'title': cleaned_title, 'link': link},
+        'search_link': search_url
+    }
+
+# --- Shared Searches ---
+class InflightSearch:
+    """A live scrape shared by every client streaming the same query.
+
+    The scrape runs as a background task, so a client disconnecting only closes its own stream.
+    """
+    def __init__(self):
+        self.results = [] # Serialized results so far, replayed to clients that join late
+        self.subscribers = set()
+
+    def subscribe(self):
+        send_results, receive_results = anyio.create_memory_object_stream(max_buffer_size=math.inf)
+        for result_json in self.results:
+            send_results.send_nowait(result_json)
+        self.subscribers.add(send_results)
+        return receive_results
+
+    def publish(self, result_json):
+        self.results.append(result_json)
+        for send_results in list(self.subscribers):
+            try:
+                send_results.send_nowait(result_json)
+            except anyio.BrokenResourceError: # That client has disconnected
+                send_results.close()
+                self.subscribers.discard(send_results)
+
+    def close(self):
+        # Ends every subscriber's stream once the scrape is over
+        for send_results in self.subscribers:
+            send_results.close()
+        self.subscribers.clear()
+
+# Searches currently being scraped, keyed by cache key, so identical concurrent queries
+# share one scrape instead of fanning out again
+INFLIGHT_SEARCHES = {}
+
+async def scrape_site(current_site, search, normalized_query, quoted_query, term_automaton):
+    """Scrapes a single site and publishes its result, if any, to the shared search."""
+    # Skip sites that recently had no match for this query
+    negative_key = f"neg:{current_site['id']}:{normalized_query}"
+    if redis_client:
+        try:
+            if await redis_client.exists(negative_key):
+                return
+        except redis.exceptions.RedisError as e:
+            logging.error(f"Redis error when checking negative cache: {e}")
+
+    search_url = current_site['search_url_template'].format(query=quoted_query)
+    # Wait for the site's own slot first so tasks queued on a slow site don't hold global slots
+    async with PER_HOST[current_site['id']], GLOBAL_OUT:
+        if current_site.get('js_required', False):
+            page_html = await fetch_js_site(current_site, search_url)
+        else:
+            page_html = await fetch_static_site(HTTP_CLIENT, current_site, search_url)
+
+    # Parse in a worker thread so concurrent responses don't serialize on the event loop
     try:
-        soup = BeautifulSoup(page_html, 'html.parser')
-        item_tag = soup.select_one(site_config['result_item_selector'])
-        if not item_tag: return None
-
-        # Extract title based on config
-        title_conf = site_config['title_from_item']
-        title_tag = item_tag.select_one(title_conf['selector']) if title_conf.get('selector') else item_tag
-        title = ""
-        if title_tag:
-            if title_conf['method'] == 'text':
-                title = title_tag.get_text(strip=True)
-            elif title_conf['method'] in ['alt', 'title']:
-                title = title_tag.get(title_conf['method'], '')
-        
-        # Extract link based on config
-        link_conf = site_config['link_from_item']
-        link_tag = item_tag.select_one(link_conf['selector']) if link_conf.get('selector') else item_tag
-        link = link_tag.get(link_conf['method']) if link_tag and link_conf.get('method') else None
-        
-        if not title or not link: return None
-
-        # Clean and validate
-        cleaned_title = clean_game_title(title)
-        search_terms = [term.strip() for term in query.split() if term.strip()]
-        if not contains_all_terms(cleaned_title, search_terms):
-            return None
-
-        # Ensure link is absolute
-        link = urljoin(search_url, link)
-
-        return {
-            'site_id': site_config['id'],
-            'site_name': site_config['name'],
-            'result': {'title': cleaned_title, 'link': link},
-            'search_link': search_url
-        }
+        result = await anyio.to_thread.run_sync(parse_html_and_extract, page_html, current_site, search_url, term_automaton)
     except Exception as e:
-        logging.error(f"Parsing error for {site_config['name']}: {e}")
-        return None
+        # Not a "no match", so don't let it hide the site through the negative cache
+        logging.error(f"Parsing error for {current_site['name']}: {e}")
+        return
+
+    if result:
+        search.publish(orjson.dumps(result).decode())
+    elif page_html and redis_client:
+        # Only remember "no match" for pages that were actually fetched, not failed requests
+        try:
+            await redis_client.set(negative_key, "0", ex=600, nx=True) # Expire after 10 minutes
+        except redis.exceptions.RedisError as e:
+            logging.error(f"Redis error when caching negative result: {e}")
+
+async def run_search(query, cache_key, search):
+    """Scrapes every site for a query, then caches the results and ends the subscribers' streams."""
+    try:
+        # Query-derived values are the same for every site, so compute them once
+        normalized_query = query.lower().strip()
+        quoted_query = quote_plus(query)
+        term_automaton = build_term_automaton(clean_search_terms(query))
+
+        # Use a task group to manage concurrent scraping tasks
+        async with anyio.create_task_group() as tg:
+            for site in SITES_CONFIG:
+                # Start a new task for each site
+                tg.start_soon(scrape_site, site, search, normalized_query, quoted_query, term_automaton)
+
+        if redis_client and search.results:
+            try:
+                # Single write with an expiry so the entry doesn't live forever
+                await redis_client.set(cache_key, orjson.dumps(search.results), ex=3600) # Expire after 1 hour
+            except redis.exceptions.RedisError as e:
+                logging.error(f"Redis error when caching results: {e}")
+    except Exception as e:
+        logging.error(f"Search error for query '{query}': {e}")
+    finally:
+        # Later arrivals read the cache written above
+        INFLIGHT_SEARCHES.pop(cache_key, None)
+        search.close()
 
 # --- Main API Endpoint ---
 @app.route('/api/search/stream')
-async def search_api_stream():
+def search_api_stream():
     query = request.args.get('query')
     if not query:
         return jsonify({'error': 'Query parameter is required'}), 400
@@ -169,65 +483,50 @@ async def search_api_stream():
     async def event_stream():
         """The main async generator for handling the search and streaming."""
         cache_key = f"search:{query.lower().strip()}"
-        
-        # 1. --- Check Cache First ---
-        if redis_client:
-            try:
-                cached_results = redis_client.lrange(cache_key, 0, -1)
-                if cached_results:
-                    logging.info(f"CACHE HIT for query: '{query}'")
-                    yield f"data: {json.dumps({'status': 'cached'})}\n\n"
-                    for result in cached_results:
-                        yield f"data: {result}\n\n"
-                    yield f"data: {json.dumps({'status': 'completed'})}\n\n"
-                    return
-            except redis.exceptions.RedisError as e:
-                logging.error(f"Redis error when checking cache: {e}")
-
-        logging.info(f"CACHE MISS for query: '{query}'. Starting live scrape.")
-        yield f"data: {json.dumps({'status': 'searching'})}\n\n"
-
-        # 2. --- Perform Live Scraping Concurrently ---
-        async with httpx.AsyncClient() as client:
-            # Use a task group to manage concurrent scraping tasks
-            async with anyio.create_task_group() as tg:
-                for site in SITES_CONFIG:
-                    
-                    async def scrape_site(current_site):
-                        """Async closure to scrape a single site."""
-                        search_url = current_site['search_url_template'].format(query=quote_plus(query))
-                        if current_site.get('js_required', False):
-                            # Run synchronous Selenium code in a separate thread
-                            page_html = await anyio.to_thread.run_sync(fetch_js_site, current_site, search_url)
-                        else:
-                            page_html = await fetch_static_site(client, current_site, search_url)
-                        
-                        result = parse_html_and_extract(page_html, current_site, search_url, query)
-                        
-                        if result:
-                            result_json = json.dumps(result)
-                            yield f"data: {result_json}\n\n"
-                            # 3. --- Cache the Result ---
-                            if redis_client:
-                                try:
-                                    redis_client.rpush(cache_key, result_json)
-                                except redis.exceptions.RedisError as e:
-                                    logging.error(f"Redis error when caching result: {e}")
-                    
-                    # Start a new task for each site
-                    tg.start_soon(scrape_site, site)
-        
-        # 4. --- Finalize Stream ---
-        if redis_client:
-            try:
-                # Set an expiration on the cache key so it doesn't live forever
-                redis_client.expire(cache_key, 3600) # Expire after 1 hour
-            except redis.exceptions.RedisError as e:
-                logging.error(f"Redis error setting expiration: {e}")
 
-        yield f"data: {json.dumps({'status': 'completed'})}\n\n"
+        # 1. --- Join an Identical Search Already in Progress ---
+        # Looked up before any await: a search finishing during the cache check below would be gone
+        search = INFLIGHT_SEARCHES.get(cache_key)
+        if search:
+            logging.info(f"Joining in-flight search for query: '{query}'")
+        else:
+            # 2. --- Check Cache ---
+            if redis_client:
+                try:
+                    cached_payload = await redis_client.get(cache_key)
+                    if cached_payload:
+                        logging.info(f"CACHE HIT for query: '{query}'")
+                        yield f"data: {orjson.dumps({'status': 'cached'}).decode()}\n\n"
+                        for result in orjson.loads(cached_payload):
+                            yield f"data: {result}\n\n"
+                        yield f"data: {orjson.dumps({'status': 'completed'}).decode()}\n\n"
+                        return
+                except redis.exceptions.RedisError as e:
+                    logging.error(f"Redis error when checking cache: {e}")
+
+            # 3. --- Start a Live Scrape ---
+            # Another client may have started one during the cache check; no await between
+            # this lookup and the registration, so concurrent misses still share one scrape
+            search = INFLIGHT_SEARCHES.get(cache_key)
+            if search:
+                logging.info(f"Joining in-flight search for query: '{query}'")
+            else:
+                logging.info(f"CACHE MISS for query: '{query}'. Starting live scrape.")
+                search = InflightSearch()
+                INFLIGHT_SEARCHES[cache_key] = search
+                BACKGROUND_TASKS.start_soon(run_search, query, cache_key, search)
+
+        # 4. --- Stream Results as Each Site Finishes ---
+        # Subscribed before the first yield so the search can't finish in between
+        async with search.subscribe() as receive_results:
+            yield f"data: {orjson.dumps({'status': 'searching'}).decode()}\n\n"
+            async for result_json in receive_results:
+                yield f"data: {result_json}\n\n"
+
+        # 5. --- Finalize Stream ---
+        yield f"data: {orjson.dumps({'status': 'completed'}).decode()}\n\n"
 
-    return Response(event_stream(), mimetype='text/event-stream')
+    return Response(stream_from_portal(event_stream()), mimetype='text/event-stream')
 
 
 # --- Main Execution Block (for local testing) ---